@@ -2,22 +2,33 @@
 """
 NextGen Manager - Telegram Group Scheduler Bot (Replit + UptimeRobot keepalive)
 
-This version runs the Telegram bot (polling) and starts a small aiohttp webserver
-so UptimeRobot can ping the root URL to keep the Repl alive.
+When PUBLIC_URL is set the bot runs in webhook mode: Telegram pushes updates to
+PUBLIC_URL/<TELEGRAM_TOKEN>, so no polling loop or keepalive server is needed.
+Without it the bot falls back to long polling and starts a small aiohttp
+webserver so UptimeRobot can ping the root URL to keep the Repl alive.
 
 Environment variables required:
 - TELEGRAM_TOKEN
 - SPREADSHEET_ID
 - GOOGLE_SERVICE_ACCOUNT_JSON  (paste full JSON text)
 - TZ (optional, e.g., "Asia/Kolkata")
+- PUBLIC_URL (optional, e.g., "https://nextgen-manager.example.repl.co")
+- PORT (optional, default 8080)
 """
 
 import os
 import json
+import asyncio
+import functools
+import heapq
 import logging
 import re
-import uuid
-from datetime import datetime, date, timedelta
+import secrets
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, date
 
 # timezone handling
 try:
@@ -27,7 +38,9 @@ except Exception:
 
 from aiohttp import web
 import gspread
+from google.auth.transport.requests import AuthorizedSession, Request
 from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
@@ -36,8 +49,7 @@ from telegram.ext import (
     ContextTypes,
     CallbackQueryHandler,
 )
-
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from telegram.request import HTTPXRequest
 
 # ----- CONFIG -----
 logging.basicConfig(level=logging.INFO)
@@ -45,6 +57,14 @@ logger = logging.getLogger(__name__)
 
 BOT_DISPLAY_NAME = "NextGen Manager"
 
+DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+TIME_RE = re.compile(r"^\d{1,2}:\d{2}$")
+RANGE_RE = re.compile(r"^\d{1,2}:\d{2}-\d{1,2}:\d{2}$")
+# what strptime("%H:%M") accepts: 1-2 ASCII digits either side, no signs or "_"
+HHMM_RE = re.compile(r"\d{1,2}:\d{1,2}", re.ASCII)  # use with fullmatch()
+
+REMINDER_LEAD_SECONDS = 15 * 60
+
 TZ_NAME = os.environ.get("TZ", "Asia/Kolkata")
 if ZoneInfo:
     try:
@@ -57,25 +77,144 @@ else:
 TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
 SPREADSHEET_ID = os.environ.get("SPREADSHEET_ID")
 GOOGLE_SERVICE_ACCOUNT_JSON = os.environ.get("GOOGLE_SERVICE_ACCOUNT_JSON")
+PUBLIC_URL = os.environ.get("PUBLIC_URL", "").rstrip("/")
+PORT = int(os.environ.get("PORT", "8080"))
 
 if not TELEGRAM_TOKEN or not SPREADSHEET_ID or not GOOGLE_SERVICE_ACCOUNT_JSON:
     raise Exception("Set TELEGRAM_TOKEN, SPREADSHEET_ID and GOOGLE_SERVICE_ACCOUNT_JSON env vars.")
 
+# Parsed once; building credentials loads the RSA key, which is slow
+SA_CREDS = Credentials.from_service_account_info(
+    json.loads(GOOGLE_SERVICE_ACCOUNT_JSON),
+    scopes=["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"],
+)
+# Shared transport for OAuth token refreshes
+TOKEN_REQUEST = Request()
+
 # Sheets objects (initialized later)
 SPREADSHEET = None
 SLOTS_SHEET = None
 PENDING_SHEET = None
 META_SHEET = None
 
+# Registered team group; loaded once in init_sheets() and updated by /setteam
+TEAM_CHAT_ID = None
+
+SLOTS_HEADER = ["id","date","start_time","end_time","username","first_name","user_id","details","created_at","reminder_sent"]
+PENDING_HEADER = ["id","date","start_time","end_time","username","first_name","user_id","details","created_at"]
+
+@dataclass(slots=True)
+class Slot:
+    """A confirmed slot (one row of the slots sheet) plus times parsed once on load."""
+    id: str
+    date: str
+    start_time: str
+    end_time: str
+    username: str = ""
+    first_name: str = ""
+    user_id: str = ""
+    details: str = ""
+    created_at: str = ""
+    reminder_sent: str = ""
+    start_min: int = field(default=None, init=False, compare=False)
+    end_min: int = field(default=None, init=False, compare=False)
+    start_ts: float = field(default=None, init=False, compare=False)
+
+    def __post_init__(self):
+        try:
+            self.start_min = to_min(self.start_time)
+            self.end_min = to_min(self.end_time)
+            self.start_ts = make_dt(self.date, self.start_time).timestamp()
+        except Exception:
+            self.start_min = self.end_min = self.start_ts = None
+
+    @classmethod
+    def from_values(cls, values):
+        return cls(*(str(v) for v in values))
+
+    @classmethod
+    def from_record(cls, rec):
+        return cls(*(str(rec.get(k, "")) for k in SLOTS_HEADER))
+
+    @property
+    def name(self):
+        return self.first_name or self.username
+
+    @property
+    def reminded(self):
+        return self.reminder_sent.strip().lower() == "yes"
+
+# In-memory mirror of the sheets, loaded once in init_sheets() and kept in
+# sync by the write helpers below so reads never hit the Sheets API.
+SLOTS_CACHE = {}                  # slot_id -> Slot
+SLOTS_BY_DATE = defaultdict(list) # "YYYY-MM-DD" -> [Slot, ...]
+PENDING_CACHE = {}                # slot_id -> record
+
+# Min-heap of (start_ts, slot_id) for future slots still owed a reminder.
+# Deleted slots are not removed; they are skipped when popped.
+REMINDER_HEAP = []
+REMINDER_WAKEUP = asyncio.Event()  # set when the heap head may have moved earlier
+
+# slot_id -> sheet row number (row 1 is the header), so finding a row never
+# needs a Worksheet.find() round-trip. NEXT_ROW is where the next append lands.
+SLOTS_ROW_INDEX = {}
+PENDING_ROW_INDEX = {}
+NEXT_ROW = {"slots": 2, "pending": 2}
+
+# The caches are write-through, but rows edited directly in the spreadsheet are
+# only picked up by a re-read. Handlers and the reminder loop (which wakes at
+# least once per TTL) call refresh_caches(), which re-reads at most once per
+# SHEETS_CACHE_TTL seconds and skips the result if a local write happened
+# while it was fetching (CACHE_GENERATION changed).
+# The 60 s default matches the old 60 s reminder job: a slot typed into the
+# sheet still gets its reminder within a minute. The bot's own writes never
+# need a re-read, so a shorter TTL would only multiply Sheets read traffic
+# (each refresh reads both sheets) for faster pickup of hand edits.
+SHEETS_CACHE_TTL = float(os.environ.get("SHEETS_CACHE_TTL", "60"))
+CACHE_LOADED_AT = 0.0
+CACHE_GENERATION = 0
+CACHE_REFRESH_LOCK = asyncio.Lock()
+
+# Sheet writes are queued and flushed in order by writer_loop(); each entry is
+# ("append", sheet_name, row_values), ("update", sheet_name, (row, slot_id,
+# column, value)) or ("delete", sheet_name, (row, slot_id)). Row numbers are
+# taken from the row index at queue time, which already accounts for every
+# write queued before it; _checked_rows() confirms them before sending.
+WRITE_QUEUE = []
+WRITE_FLUSH_INTERVAL = 0.25  # seconds
+WRITE_BATCH_MAX = 50         # flush early once this many writes are queued
+WRITE_WAKEUP = asyncio.Event()
+WRITE_LOCK = asyncio.Lock()
+# A failing batch is retried with exponential backoff (1 s, 2 s, 4 s, ... up to
+# WRITE_BACKOFF_MAX) and dropped after WRITE_MAX_ATTEMPTS, or immediately on a
+# 4xx other than 429, which will never succeed on retry.
+WRITE_MAX_ATTEMPTS = 5
+WRITE_BACKOFF_MAX = 60.0  # seconds
+WRITE_FAILURES = 0        # consecutive failures of the batch at the head of the queue
+WRITE_RETRY_AT = 0.0      # time.monotonic() before which flushes are skipped
+
+# gspread is blocking (requests); every Sheets call from a coroutine goes
+# through _run() so it never stalls polling or other handlers.
+SHEETS_WORKERS = 4
+SHEETS_POOL = ThreadPoolExecutor(max_workers=SHEETS_WORKERS, thread_name_prefix="sheets")
+
+# One keep-alive HTTPS session shared by every Sheets call (set up in init_sheets)
+SHEETS_SESSION = None
+
 # ----- Sheets helpers -----
+async def _run(fn, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(SHEETS_POOL, functools.partial(fn, *args, **kwargs))
+
 def init_sheets():
-    global SPREADSHEET, SLOTS_SHEET, PENDING_SHEET, META_SHEET
-    sa_info = json.loads(GOOGLE_SERVICE_ACCOUNT_JSON)
-    creds = Credentials.from_service_account_info(
-        sa_info,
-        scopes=["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"],
-    )
-    client = gspread.authorize(creds)
+    global SPREADSHEET, SLOTS_SHEET, PENDING_SHEET, META_SHEET, TEAM_CHAT_ID, SHEETS_SESSION
+    # fetch the access token up front, and only when the current one has expired
+    if not SA_CREDS.valid:
+        SA_CREDS.refresh(TOKEN_REQUEST)
+    # size the connection pool to the worker pool so concurrent calls reuse
+    # warm connections instead of opening (and TLS-handshaking) new ones
+    SHEETS_SESSION = AuthorizedSession(SA_CREDS, auth_request=TOKEN_REQUEST)
+    SHEETS_SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=SHEETS_WORKERS))
+    client = gspread.Client(auth=SA_CREDS, session=SHEETS_SESSION)
     SPREADSHEET = client.open_by_key(SPREADSHEET_ID)
 
     # slots (confirmed) sheet
@@ -83,14 +222,14 @@ def init_sheets():
         SLOTS_SHEET = SPREADSHEET.worksheet("slots")
     except Exception:
         SLOTS_SHEET = SPREADSHEET.add_worksheet(title="slots", rows="2000", cols="20")
-        SLOTS_SHEET.append_row(["id","date","start_time","end_time","username","first_name","user_id","details","created_at","reminder_sent"])
+        SLOTS_SHEET.append_row(SLOTS_HEADER)
 
     # pending sheet (for tentative slots awaiting confirmation)
     try:
         PENDING_SHEET = SPREADSHEET.worksheet("pending")
     except Exception:
         PENDING_SHEET = SPREADSHEET.add_worksheet(title="pending", rows="500", cols="20")
-        PENDING_SHEET.append_row(["id","date","start_time","end_time","username","first_name","user_id","details","created_at"])
+        PENDING_SHEET.append_row(PENDING_HEADER)
 
     # meta sheet (store team_chat_id etc.)
     try:
@@ -99,6 +238,87 @@ def init_sheets():
         META_SHEET = SPREADSHEET.add_worksheet(title="meta", rows="50", cols="2")
         META_SHEET.append_row(["key","value"])
 
+    team_chat = get_meta_value("team_chat_id")
+    try:
+        TEAM_CHAT_ID = int(team_chat) if team_chat not in (None, "") else None
+    except ValueError:
+        logger.warning("Ignoring invalid team_chat_id in meta sheet: %r", team_chat)
+    load_caches(*fetch_records())
+
+def fetch_records():
+    # numericise_ignore keeps ids / user_ids as strings, matching what we append
+    return (
+        SLOTS_SHEET.get_all_records(numericise_ignore=["all"]),
+        PENDING_SHEET.get_all_records(numericise_ignore=["all"]),
+    )
+
+def load_caches(slot_records, pending_records):
+    global CACHE_LOADED_AT
+    SLOTS_CACHE.clear()
+    SLOTS_BY_DATE.clear()
+    SLOTS_ROW_INDEX.clear()
+    REMINDER_HEAP.clear()
+    for i, rec in enumerate(slot_records):
+        if rec.get("id"):
+            slot = Slot.from_record(rec)
+            _cache_slot(slot)
+            SLOTS_ROW_INDEX[slot.id] = i + 2
+    NEXT_ROW["slots"] = len(slot_records) + 2
+
+    PENDING_CACHE.clear()
+    PENDING_ROW_INDEX.clear()
+    for i, rec in enumerate(pending_records):
+        if rec.get("id"):
+            PENDING_CACHE[rec["id"]] = rec
+            PENDING_ROW_INDEX[rec["id"]] = i + 2
+    NEXT_ROW["pending"] = len(pending_records) + 2
+    CACHE_LOADED_AT = time.monotonic()
+    logger.info("Loaded %d slots and %d pending slots", len(SLOTS_CACHE), len(PENDING_CACHE))
+
+async def refresh_caches():
+    global CACHE_LOADED_AT
+    if time.monotonic() - CACHE_LOADED_AT < SHEETS_CACHE_TTL:
+        return
+    # concurrent callers wait for, and then share, a single fetch
+    async with CACHE_REFRESH_LOCK:
+        if time.monotonic() - CACHE_LOADED_AT < SHEETS_CACHE_TTL:
+            return
+        await flush_writes()
+        if WRITE_QUEUE:
+            return  # writes are backing off; a reload now would drop them from the cache
+        generation = CACHE_GENERATION
+        try:
+            records = await _run(fetch_records)
+        except Exception:
+            logger.exception("Failed to refresh sheet caches")
+            CACHE_LOADED_AT = time.monotonic()  # retry after the TTL, not on every command
+            return
+        if generation != CACHE_GENERATION or WRITE_QUEUE:
+            return  # local writes raced the fetch; keep the cache and retry next time
+        load_caches(*records)
+
+def request_resync():
+    # make the next refresh_caches() call reload regardless of the TTL
+    global CACHE_LOADED_AT
+    CACHE_LOADED_AT = 0.0
+
+def _cache_slot(slot):
+    SLOTS_CACHE[slot.id] = slot
+    SLOTS_BY_DATE[slot.date].append(slot)
+    if slot.start_ts is not None and slot.start_ts > time.time() and not slot.reminded:
+        heapq.heappush(REMINDER_HEAP, (slot.start_ts, slot.id))
+        REMINDER_WAKEUP.set()
+
+def _uncache_slot(slot_id):
+    slot = SLOTS_CACHE.pop(slot_id, None)
+    if slot is None:
+        return
+    day = SLOTS_BY_DATE.get(slot.date)
+    if day is not None:
+        day.remove(slot)
+        if not day:
+            del SLOTS_BY_DATE[slot.date]
+
 def get_meta_value(key):
     try:
         rows = META_SHEET.get_all_records()
@@ -118,42 +338,184 @@ def set_meta_value(key, value):
     META_SHEET.append_row([key, value])
 
 def all_slots_records():
-    return SLOTS_SHEET.get_all_records()
+    return list(SLOTS_CACHE.values())
+
+def slots_for_date(date_str):
+    return SLOTS_BY_DATE.get(date_str, [])
 
 def all_pending_records():
-    return PENDING_SHEET.get_all_records()
+    return list(PENDING_CACHE.values())
+
+def _add_row(index, sheet_name, slot_id):
+    index[slot_id] = NEXT_ROW[sheet_name]
+    NEXT_ROW[sheet_name] += 1
+
+def _drop_row(index, sheet_name, slot_id):
+    # rows below the deleted one shift up by one
+    row = index.pop(slot_id)
+    for sid, r in index.items():
+        if r > row:
+            index[sid] = r - 1
+    NEXT_ROW[sheet_name] -= 1
+
+def queue_write(op, sheet_name, payload):
+    global CACHE_GENERATION
+    CACHE_GENERATION += 1
+    WRITE_QUEUE.append((op, sheet_name, payload))
+    if len(WRITE_QUEUE) >= WRITE_BATCH_MAX:
+        WRITE_WAKEUP.set()
+
+def _write_batches(ops):
+    # consecutive writes of the same kind to the same sheet become one API call
+    batches = []
+    for op, sheet_name, payload in ops:
+        if batches and batches[-1][:2] == (op, sheet_name):
+            batches[-1][2].append(payload)
+        else:
+            batches.append((op, sheet_name, [payload]))
+    return batches
+
+def _checked_rows(op, sheet_name, keyed_rows):
+    """Confirm queued (row, slot_id) pairs against column A and return the rows to write.
+
+    The row index is only right while nobody inserts or removes rows in the
+    spreadsheet by hand. If any id is not where we expect it, the rows are
+    looked up in column A instead (None if the slot is gone) and a full
+    cache reload is requested.
+    """
+    # deletes are queued relative to the ones before them; map back to the current sheet
+    expected = []
+    for k, (row, slot_id) in enumerate(keyed_rows):
+        if op == "delete":
+            for prev_row, _ in reversed(keyed_rows[:k]):
+                if row >= prev_row:
+                    row += 1
+        expected.append((row, slot_id))
+    found = SPREADSHEET.values_batch_get([f"{sheet_name}!A{row}" for row, _ in expected])["valueRanges"]
+    actual = [str(vr.get("values", [[""]])[0][0]) for vr in found]
+    if all(a == slot_id for a, (_, slot_id) in zip(actual, expected)):
+        return [row for row, _ in keyed_rows]
+
+    logger.warning("Row index for %s is out of date (sheet edited by hand?); resolving rows by id", sheet_name)
+    request_resync()
+    ids = [str(r[0]) if r else "" for r in SPREADSHEET.values_get(f"{sheet_name}!A:A").get("values", [])]
+    rows = []
+    for _, slot_id in keyed_rows:
+        if slot_id not in ids:
+            logger.warning("Slot %s is no longer in %s; skipping %s", slot_id, sheet_name, op)
+            rows.append(None)
+            continue
+        i = ids.index(slot_id)
+        rows.append(i + 1)
+        if op == "delete":
+            ids.pop(i)
+    return rows
+
+def _send_batch(op, sheet_name, payloads):
+    if op == "append":
+        last_col = "J" if sheet_name == "slots" else "I"
+        SPREADSHEET.values_append(
+            f"{sheet_name}!A:{last_col}",
+            {"valueInputOption": "RAW"},
+            {"values": payloads},
+        )
+    elif op == "update":
+        rows = _checked_rows(op, sheet_name, [(row, slot_id) for row, slot_id, _, _ in payloads])
+        data = [
+            {"range": f"{sheet_name}!{col}{row}", "values": [[value]]}
+            for row, (_, _, col, value) in zip(rows, payloads)
+            if row
+        ]
+        if data:
+            SPREADSHEET.values_batch_update({"valueInputOption": "RAW", "data": data})
+    elif op == "delete":
+        # deleteDimension requests are applied in order, matching the queued row numbers
+        rows = [row for row in _checked_rows(op, sheet_name, payloads) if row]
+        sheet_id = SLOTS_SHEET.id if sheet_name == "slots" else PENDING_SHEET.id
+        if rows:
+            SPREADSHEET.batch_update({
+                "requests": [
+                    {"deleteDimension": {"range": {"sheetId": sheet_id, "dimension": "ROWS", "startIndex": row - 1, "endIndex": row}}}
+                    for row in rows
+                ],
+            })
+
+async def flush_writes(force=False):
+    """Send all queued writes to the Sheets API, one call per batch, off the event loop.
+
+    While a failed batch is backing off this is a no-op unless force is set.
+    """
+    global WRITE_QUEUE, WRITE_FAILURES, WRITE_RETRY_AT
+    async with WRITE_LOCK:
+        if not WRITE_QUEUE or (not force and time.monotonic() < WRITE_RETRY_AT):
+            return
+        ops, WRITE_QUEUE = WRITE_QUEUE, []
+        sent = 0
+        for op, sheet_name, payloads in _write_batches(ops):
+            try:
+                await _run(_send_batch, op, sheet_name, payloads)
+            except Exception as exc:
+                WRITE_FAILURES += 1
+                status = getattr(getattr(exc, "response", None), "status_code", None)
+                permanent = status is not None and 400 <= status < 500 and status != 429
+                if permanent or WRITE_FAILURES >= WRITE_MAX_ATTEMPTS:
+                    logger.exception(
+                        "Dropping %s of %d row(s) in %s after %d attempt(s) (status %s)",
+                        op, len(payloads), sheet_name, WRITE_FAILURES, status,
+                    )
+                    # the cache assumed this write landed; reload it from the sheet
+                    request_resync()
+                    WRITE_FAILURES = 0
+                    sent += len(payloads)
+                    continue
+                delay = min(WRITE_BACKOFF_MAX, 2 ** (WRITE_FAILURES - 1))
+                logger.exception(
+                    "Failed to %s %d row(s) in %s (attempt %d, status %s); retrying in %.0f s",
+                    op, len(payloads), sheet_name, WRITE_FAILURES, status, delay,
+                )
+                # later writes depend on this one; retry everything from here
+                WRITE_QUEUE[:0] = ops[sent:]
+                WRITE_RETRY_AT = time.monotonic() + delay
+                return
+            WRITE_FAILURES = 0
+            sent += len(payloads)
+
+async def writer_loop():
+    while True:
+        try:
+            await asyncio.wait_for(WRITE_WAKEUP.wait(), timeout=WRITE_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        WRITE_WAKEUP.clear()
+        await flush_writes()
 
 def append_slot_row(row_values):
-    SLOTS_SHEET.append_row(row_values)
+    queue_write("append", "slots", row_values)
+    slot = Slot.from_values(row_values)
+    _cache_slot(slot)
+    _add_row(SLOTS_ROW_INDEX, "slots", slot.id)
 
 def append_pending_row(row_values):
-    PENDING_SHEET.append_row(row_values)
+    queue_write("append", "pending", row_values)
+    rec = dict(zip(PENDING_HEADER, row_values))
+    PENDING_CACHE[rec["id"]] = rec
+    _add_row(PENDING_ROW_INDEX, "pending", rec["id"])
 
 def find_slot_row(slot_id):
-    try:
-        c = SLOTS_SHEET.find(slot_id)
-        return c.row
-    except Exception:
-        return None
+    return SLOTS_ROW_INDEX.get(slot_id)
 
 def find_pending_row(slot_id):
-    try:
-        c = PENDING_SHEET.find(slot_id)
-        return c.row
-    except Exception:
-        return None
+    return PENDING_ROW_INDEX.get(slot_id)
 
 def get_pending_record(slot_id):
-    rows = all_pending_records()
-    for r in rows:
-        if r.get("id") == slot_id:
-            return r
-    return None
+    return PENDING_CACHE.get(slot_id)
 
 def delete_pending(slot_id):
     row = find_pending_row(slot_id)
     if row:
-        PENDING_SHEET.delete_rows(row)
+        queue_write("delete", "pending", (row, slot_id))
+        _drop_row(PENDING_ROW_INDEX, "pending", slot_id)
+        PENDING_CACHE.pop(slot_id, None)
         return True
     return False
 
@@ -161,25 +523,40 @@ def update_reminder_sent(slot_id):
     row = find_slot_row(slot_id)
     if not row:
         return False
-    # reminder_sent column is 10 (header position)
-    SLOTS_SHEET.update_cell(row, 10, "yes")
+    # reminder_sent column is J (header position 10)
+    queue_write("update", "slots", (row, slot_id, "J", "yes"))
+    SLOTS_CACHE[slot_id].reminder_sent = "yes"
     return True
 
 def delete_slot(slot_id):
     row = find_slot_row(slot_id)
     if row:
-        SLOTS_SHEET.delete_rows(row)
+        queue_write("delete", "slots", (row, slot_id))
+        _drop_row(SLOTS_ROW_INDEX, "slots", slot_id)
+        _uncache_slot(slot_id)
         return True
     return False
 
 # ----- Utilities -----
+def parse_hhmm(time_str):
+    # "HH:MM" (24-hour) -> (hour, minute); much cheaper than strptime
+    if not HHMM_RE.fullmatch(time_str):
+        raise ValueError(f"not HH:MM: {time_str!r}")
+    h, m = time_str.split(":")
+    h, m = int(h), int(m)
+    if not (0 <= h < 24 and 0 <= m < 60):
+        raise ValueError(f"time out of range: {time_str!r}")
+    return h, m
+
 def make_dt(date_str, time_str):
     d = date.fromisoformat(date_str)
-    hhmm = datetime.strptime(time_str, "%H:%M").time()
-    if TZ:
-        return datetime.combine(d, hhmm).replace(tzinfo=TZ)
-    else:
-        return datetime.combine(d, hhmm)
+    h, m = parse_hhmm(time_str)
+    return datetime(d.year, d.month, d.day, h, m, tzinfo=TZ)
+
+def to_min(time_str):
+    # "HH:MM" -> minutes since midnight
+    h, m = parse_hhmm(time_str)
+    return h * 60 + m
 
 def overlaps(a_start, a_end, b_start, b_end):
     return (a_start < b_end) and (b_start < a_end)
@@ -200,15 +577,18 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(txt, parse_mode='Markdown')
 
 async def setteam(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    global TEAM_CHAT_ID
     chat = update.effective_chat
     if chat.type not in ("group", "supergroup"):
         await update.message.reply_text("Run /setteam inside the group you want the bot to post team alerts to.")
         return
-    set_meta_value("team_chat_id", str(chat.id))
+    await _run(set_meta_value, "team_chat_id", str(chat.id))
+    TEAM_CHAT_ID = chat.id
+    REMINDER_WAKEUP.set()
     await update.message.reply_text(f"Registered this group (id={chat.id}) as the team channel for {BOT_DISPLAY_NAME} alerts.")
 
 async def addslot(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    team_chat = get_meta_value("team_chat_id")
+    team_chat = TEAM_CHAT_ID
     if not team_chat:
         await update.message.reply_text("No team group registered yet. Add the bot to your group and run /setteam inside the group first.")
         return
@@ -218,6 +598,8 @@ async def addslot(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("You must add slots from the registered team group. Switch to your team group and run /addslot there.")
         return
 
+    await refresh_caches()
+
     args = context.args
     if not args:
         await update.message.reply_text("Usage: /addslot YYYY-MM-DD HH:MM HH:MM Details... OR /addslot HH:MM-HH:MM Details...")
@@ -225,16 +607,16 @@ async def addslot(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # parse
     date_str, start_str, end_str, details = None, None, None, ""
-    if len(args) >= 3 and re.match(r"^\d{4}-\d{2}-\d{2}$", args[0]):
+    if len(args) >= 3 and DATE_RE.match(args[0]):
         date_str = args[0]
         start_str = args[1]
         end_str = args[2]
         details = " ".join(args[3:]) or "Busy"
-    elif re.match(r"^\d{1,2}:\d{2}-\d{1,2}:\d{2}$", args[0]):
+    elif RANGE_RE.match(args[0]):
         date_str = date.today().isoformat()
         start_str, end_str = args[0].split("-")
         details = " ".join(args[1:]) or "Busy"
-    elif len(args) >= 2 and re.match(r"^\d{1,2}:\d{2}$", args[0]) and re.match(r"^\d{1,2}:\d{2}$", args[1]):
+    elif len(args) >= 2 and TIME_RE.match(args[0]) and TIME_RE.match(args[1]):
         date_str = date.today().isoformat()
         start_str = args[0]
         end_str = args[1]
@@ -244,9 +626,9 @@ async def addslot(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     try:
-        datetime.strptime(start_str, "%H:%M")
-        datetime.strptime(end_str, "%H:%M")
-    except Exception:
+        parse_hhmm(start_str)
+        parse_hhmm(end_str)
+    except ValueError:
         await update.message.reply_text("Times must be HH:MM (24-hour).")
         return
 
@@ -262,20 +644,16 @@ async def addslot(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     user = update.effective_user
-    slot_id = uuid.uuid4().hex[:10]
+    slot_id = secrets.token_hex(5)  # 10 hex chars, same as before
     created_at = datetime.now(TZ).isoformat() if TZ else datetime.now().isoformat()
 
     # check overlaps with confirmed slots for that date
+    start_min, end_min = to_min(start_str), to_min(end_str)
     overlaps_found = []
-    for rec in all_slots_records():
-        if rec.get("date") != date_str:
-            continue
-        try:
-            other_start = make_dt(rec["date"], rec["start_time"])
-            other_end = make_dt(rec["date"], rec["end_time"])
-        except Exception:
+    for rec in slots_for_date(date_str):
+        if rec.start_min is None:
             continue
-        if overlaps(start_dt, end_dt, other_start, other_end):
+        if overlaps(start_min, end_min, rec.start_min, rec.end_min):
             overlaps_found.append(rec)
 
     if not overlaps_found:
@@ -289,10 +667,10 @@ async def addslot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     pending_row = [slot_id, date_str, start_str, end_str, user.username or "", user.first_name or "", str(user.id), details, created_at]
     append_pending_row(pending_row)
 
-    text = f"⚠️ {user.first_name or user.username} wants to add a slot that overlaps {len(overlaps_found)} existing slot(s):\n"
-    for o in overlaps_found:
-        text += f"- {o.get('first_name') or o.get('username')}: {o['start_time']}-{o['end_time']} — {o['details']}\n"
-    text += "\nCreator, please confirm or cancel."
+    lines = [f"⚠️ {user.first_name or user.username} wants to add a slot that overlaps {len(overlaps_found)} existing slot(s):"]
+    lines.extend(f"- {o.name}: {o.start_time}-{o.end_time} — {o.details}" for o in overlaps_found)
+    lines.append("\nCreator, please confirm or cancel.")
+    text = "\n".join(lines)
 
     keyboard = InlineKeyboardMarkup(
         [
@@ -310,7 +688,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     data = query.data or ""
     user = query.from_user
-    team_chat = get_meta_value("team_chat_id")
+    team_chat = TEAM_CHAT_ID
+    await refresh_caches()
 
     if data.startswith("confirm:"):
         slot_id = data.split(":",1)[1]
@@ -340,27 +719,25 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         delete_pending(slot_id)
 
         # find overlapping confirmed slots (to show in message)
-        start_dt = make_dt(pending['date'], pending['start_time'])
-        end_dt = make_dt(pending['date'], pending['end_time'])
+        confirmed = SLOTS_CACHE[slot_id]
         overlaps_list = []
-        for rec in all_slots_records():
-            if rec.get('id') == slot_id:
+        for rec in slots_for_date(confirmed.date):
+            if rec.id == slot_id or rec.start_min is None:
                 continue
-            try:
-                other_start = make_dt(rec['date'], rec['start_time'])
-                other_end = make_dt(rec['date'], rec['end_time'])
-            except Exception:
-                continue
-            if rec.get('date') == pending.get('date') and overlaps(start_dt, end_dt, other_start, other_end):
+            if overlaps(confirmed.start_min, confirmed.end_min, rec.start_min, rec.end_min):
                 overlaps_list.append(rec)
 
         # post confirmation and overlaps to the group only
-        reply_text = f"✅ Slot confirmed by {pending.get('first_name') or pending.get('username')}: {pending.get('date')} {pending.get('start_time')}-{pending.get('end_time')} — {pending.get('details')} (ID {pending.get('id')})\\n\\nOverlaps with:\\n"
+        lines = [
+            f"✅ Slot confirmed by {pending.get('first_name') or pending.get('username')}: {pending.get('date')} {pending.get('start_time')}-{pending.get('end_time')} — {pending.get('details')} (ID {pending.get('id')})",
+            "",
+            "Overlaps with:",
+        ]
         if overlaps_list:
-            for o in overlaps_list:
-                reply_text += f"- {o.get('first_name') or o.get('username')}: {o.get('start_time')}-{o.get('end_time')} — {o.get('details')}\\n"
+            lines.extend(f"- {o.name}: {o.start_time}-{o.end_time} — {o.details}" for o in overlaps_list)
         else:
-            reply_text += "- None\\n"
+            lines.append("- None")
+        reply_text = "\n".join(lines)
 
         if team_chat:
             await context.bot.send_message(chat_id=int(team_chat), text=reply_text)
@@ -381,7 +758,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
 async def me_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    team_chat = get_meta_value("team_chat_id")
+    team_chat = TEAM_CHAT_ID
     if not team_chat:
         await update.message.reply_text("No team group registered yet. Run /setteam in your group.")
         return
@@ -391,23 +768,23 @@ async def me_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Run /me inside the registered group.")
         return
 
+    await refresh_caches()
+
     args = context.args
     target_date = date.today().isoformat()
-    if args and re.match(r"^\\d{4}-\\d{2}-\\d{2}$", args[0]):
+    if args and DATE_RE.match(args[0]):
         target_date = args[0]
-    records = all_slots_records()
     user_id = str(update.effective_user.id)
-    my_slots = [r for r in records if r.get("user_id") == user_id and r.get("date") == target_date]
+    my_slots = [r for r in slots_for_date(target_date) if r.user_id == user_id]
     if not my_slots:
         await update.message.reply_text(f"No slots for {target_date}.")
         return
-    text = f"Your slots for {target_date}:\\n"
-    for r in my_slots:
-        text += f"- ID {r['id']}: {r['start_time']}-{r['end_time']} — {r['details']}\\n"
-    await update.message.reply_text(text)
+    lines = [f"Your slots for {target_date}:"]
+    lines.extend(f"- ID {r.id}: {r.start_time}-{r.end_time} — {r.details}" for r in my_slots)
+    await update.message.reply_text("\n".join(lines))
 
 async def team_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    team_chat = get_meta_value("team_chat_id")
+    team_chat = TEAM_CHAT_ID
     if not team_chat:
         await update.message.reply_text("No team group registered yet. Run /setteam in your group.")
         return
@@ -415,38 +792,36 @@ async def team_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Run /team inside the registered group.")
         return
 
+    await refresh_caches()
+
     args = context.args
     target_date = date.today().isoformat()
-    if args and re.match(r"^\\d{4}-\\d{2}-\\d{2}$", args[0]):
+    if args and DATE_RE.match(args[0]):
         target_date = args[0]
-    records = all_slots_records()
-    day_slots = [r for r in records if r.get("date") == target_date]
+    day_slots = list(slots_for_date(target_date))
     if not day_slots:
         await update.message.reply_text(f"No slots for {target_date}.")
         return
-    text = f"Team slots for {target_date}:\\n"
-    for r in day_slots:
-        text += f"- {r.get('first_name') or r.get('username')}: {r['start_time']}-{r['end_time']} — {r['details']} (ID {r['id']})\\n"
-
-    # detect overlaps
-    overlaps_text = ""
-    for i in range(len(day_slots)):
-        a = day_slots[i]
-        a_start = make_dt(a['date'], a['start_time'])
-        a_end = make_dt(a['date'], a['end_time'])
-        for j in range(i+1, len(day_slots)):
-            b = day_slots[j]
-            b_start = make_dt(b['date'], b['start_time'])
-            b_end = make_dt(b['date'], b['end_time'])
-            if overlaps(a_start, a_end, b_start, b_end):
-                overlaps_text += f"- {a.get('first_name') or a.get('username')} ({a['start_time']}-{a['end_time']}) overlaps with {b.get('first_name') or b.get('username')} ({b['start_time']}-{b['end_time']})\\n"
-
-    if overlaps_text:
-        text += "\\n⚠️ Overlaps:\\n" + overlaps_text
-    await update.message.reply_text(text)
+    lines = [f"Team slots for {target_date}:"]
+    lines.extend(f"- {r.name}: {r.start_time}-{r.end_time} — {r.details} (ID {r.id})" for r in day_slots)
+
+    # detect overlaps: sweep slots in start order, keeping those still running
+    overlap_lines = []
+    spans = sorted((r for r in day_slots if r.start_min is not None), key=lambda r: r.start_min)
+    active = []
+    for b in spans:
+        active = [a for a in active if a.end_min > b.start_min]
+        for a in active:
+            overlap_lines.append(f"- {a.name} ({a.start_time}-{a.end_time}) overlaps with {b.name} ({b.start_time}-{b.end_time})")
+        active.append(b)
+
+    if overlap_lines:
+        lines.append("\n⚠️ Overlaps:")
+        lines.extend(overlap_lines)
+    await update.message.reply_text("\n".join(lines))
 
 async def cancel_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    team_chat = get_meta_value("team_chat_id")
+    team_chat = TEAM_CHAT_ID
     if not team_chat:
         await update.message.reply_text("No team group registered yet. Run /setteam in your group.")
         return
@@ -454,52 +829,72 @@ async def cancel_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Run /cancel inside the registered group.")
         return
 
+    await refresh_caches()
+
     args = context.args
     if not args:
         await update.message.reply_text("Usage: /cancel <slot_id>")
         return
     slot_id = args[0]
-    row = find_slot_row(slot_id)
-    if row:
-        owner_user_id = SLOTS_SHEET.cell(row, 7).value  # user_id column
-        if str(owner_user_id) != str(update.effective_user.id):
+    rec = SLOTS_CACHE.get(slot_id)
+    if rec:
+        if rec.user_id != str(update.effective_user.id):
             await update.message.reply_text("You can only cancel slots you created.")
             return
-        SLOTS_SHEET.delete_rows(row)
+        delete_slot(slot_id)
         await context.bot.send_message(chat_id=int(team_chat), text=f"🗑️ Slot {slot_id} removed by {update.effective_user.first_name or update.effective_user.username}.")
         return
-    prow = find_pending_row(slot_id)
-    if prow:
-        owner_user_id = PENDING_SHEET.cell(prow, 7).value
-        if str(owner_user_id) != str(update.effective_user.id):
+    pending = get_pending_record(slot_id)
+    if pending:
+        if str(pending.get("user_id")) != str(update.effective_user.id):
             await update.message.reply_text("You can only cancel pending slots you created.")
             return
-        PENDING_SHEET.delete_rows(prow)
+        delete_pending(slot_id)
         await context.bot.send_message(chat_id=int(team_chat), text=f"Cancelled pending slot {slot_id} by {update.effective_user.first_name or update.effective_user.username}.")
         return
     await update.message.reply_text("Slot ID not found.")
 
 # ----- Reminder job -----
 async def check_reminders(application):
-    team_chat = get_meta_value("team_chat_id")
+    team_chat = TEAM_CHAT_ID
     if not team_chat:
         return
-    now = datetime.now(TZ) if TZ else datetime.now()
-    window_end = now + timedelta(minutes=15)
-    for rec in all_slots_records():
-        if str(rec.get("reminder_sent")).strip().lower() == "yes":
+    now_ts = time.time()
+    window_end = now_ts + REMINDER_LEAD_SECONDS
+    while REMINDER_HEAP and REMINDER_HEAP[0][0] <= window_end:
+        start_ts, slot_id = heapq.heappop(REMINDER_HEAP)
+        rec = SLOTS_CACHE.get(slot_id)
+        if rec is None or rec.reminded:
             continue
+        if now_ts < start_ts:
+            # send concurrently; reminders due in the same minute don't wait on each other
+            application.create_task(send_reminder(application, team_chat, rec))
+            update_reminder_sent(rec.id)
+
+async def send_reminder(application, team_chat, rec):
+    text = f"🔔 Reminder: {rec.name}'s \"{rec.details}\" starts at {rec.start_time} (in <=15 minutes).\n(ID {rec.id})"
+    try:
+        await application.bot.send_message(chat_id=int(team_chat), text=text)
+    except Exception:
+        logger.exception("Failed to send reminder to team chat %s", team_chat)
+
+async def reminder_loop(application):
+    # sleep until the earliest reminder is due, or until a new slot / team chat
+    # wakes us, but never longer than the cache TTL so hand-added rows are seen
+    while True:
+        REMINDER_WAKEUP.clear()
         try:
-            start_dt = make_dt(rec['date'], rec['start_time'])
+            await refresh_caches()
+            await check_reminders(application)
         except Exception:
-            continue
-        if now < start_dt <= window_end:
-            text = f"🔔 Reminder: {rec.get('first_name') or rec.get('username')}'s \"{rec.get('details')}\" starts at {rec.get('start_time')} (in <=15 minutes).\\n(ID {rec.get('id')})"
-            try:
-                await application.bot.send_message(chat_id=int(team_chat), text=text)
-            except Exception:
-                logger.exception("Failed to send reminder to team chat %s", team_chat)
-            update_reminder_sent(rec.get('id'))
+            logger.exception("Reminder check failed")
+        timeout = SHEETS_CACHE_TTL
+        if REMINDER_HEAP and TEAM_CHAT_ID:
+            timeout = min(timeout, max(0, REMINDER_HEAP[0][0] - REMINDER_LEAD_SECONDS - time.time()))
+        try:
+            await asyncio.wait_for(REMINDER_WAKEUP.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
 
 # ----- Minimal webserver for keepalive -----
 async def start_webserver():
@@ -507,17 +902,61 @@ async def start_webserver():
         return web.Response(text="NextGen Manager is alive.")
     app = web.Application()
     app.router.add_get("/", handle_root)
-    port = int(os.environ.get("PORT", "8080"))
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, "0.0.0.0", port)
+    site = web.TCPSite(runner, "0.0.0.0", PORT)
     await site.start()
-    logger.info(f"Webserver started on port {port}")
+    logger.info(f"Webserver started on port {PORT}")
 
 # ----- Startup -----
-async def main():
+# Long-running tasks started in post_init(), cancelled in post_shutdown()
+BACKGROUND_TASKS = []
+
+async def post_init(application):
+    BACKGROUND_TASKS.append(asyncio.create_task(writer_loop()))
+    BACKGROUND_TASKS.append(asyncio.create_task(reminder_loop(application)))
+
+    # in polling mode, start webserver in background (so UptimeRobot can ping);
+    # in webhook mode the webhook server already listens on PORT
+    if not PUBLIC_URL:
+        BACKGROUND_TASKS.append(asyncio.create_task(start_webserver()))
+
+async def post_shutdown(application):
+    # Stop the loops before the final flush, but only while holding WRITE_LOCK:
+    # flush_writes() takes the whole queue before sending, so cancelling a loop
+    # mid-flush would silently discard every batch after the one in flight.
+    async with WRITE_LOCK:
+        for task in BACKGROUND_TASKS:
+            task.cancel()
+        await asyncio.gather(*BACKGROUND_TASKS, return_exceptions=True)
+        BACKGROUND_TASKS.clear()
+    await flush_writes(force=True)
+
+def main():
     init_sheets()
-    application = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    application = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .request(HTTPXRequest(
+            connection_pool_size=32,
+            pool_timeout=5.0,
+            read_timeout=25.0,
+            write_timeout=15.0,
+            connect_timeout=10.0,
+            http_version="2",
+        ))
+        # Bot.get_updates() adds the long-poll timeout (25 s, see run_polling
+        # below) on top of this read timeout, so this is only the margin for
+        # the response to arrive: 25 + 15 = 40 s per getUpdates call. On PTB
+        # 20.x, run_polling() passes its own read_timeout (default 2 s)
+        # instead, which gives 27 s.
+        .get_updates_request(HTTPXRequest(read_timeout=15.0, http_version="2"))
+        # handle up to one update per pooled connection at a time
+        .concurrent_updates(32)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("setteam", setteam))
@@ -527,17 +966,18 @@ async def main():
     application.add_handler(CommandHandler("cancel", cancel_cmd))
     application.add_handler(CallbackQueryHandler(handle_callback))
 
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(check_reminders, "interval", seconds=60, args=[application])
-    scheduler.start()
-
-    # start webserver in background (so UptimeRobot can ping)
-    import asyncio
-    asyncio.create_task(start_webserver())
-
-    logger.info("NextGen Manager bot starting polling...")
-    await application.run_polling()
+    if PUBLIC_URL:
+        logger.info("NextGen Manager bot starting webhook at %s...", PUBLIC_URL)
+        application.run_webhook(
+            listen="0.0.0.0",
+            port=PORT,
+            url_path=TELEGRAM_TOKEN,
+            webhook_url=f"{PUBLIC_URL}/{TELEGRAM_TOKEN}",
+        )
+    else:
+        logger.info("NextGen Manager bot starting polling...")
+        # timeout is the server-side long-poll wait, added to the read timeout above
+        application.run_polling(poll_interval=0, timeout=25)
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
+    main()